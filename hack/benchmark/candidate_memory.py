@@ -0,0 +1,73 @@
+# SPDX-FileCopyrightText: Copyright 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+# Memory benchmark of a cached completion entry: bytes per candidate held as a
+# list of dicts against the compact PrefixIndex form cgo_cache keeps now.
+#
+#   python3 hack/benchmark/candidate_memory.py
+
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(__file__),
+        "../../rplugin/python3/deoplete/source/deoplete_cgo",
+    ),
+)
+
+from candidates import pack_candidates, unpack_candidates  # noqa: E402
+from prefix_index import PrefixIndex  # noqa: E402
+
+CANDIDATES = 20000
+
+KINDS = ["function", "macro definition", "typedef", "variable", "struct"]
+
+
+def generate():
+    # like candidates loaded from the completion store, every string is its
+    # own object
+    candidates = []
+    for n in range(CANDIDATES):
+        word = "symbol_%05d" % n
+        signature = "%s(const char *name, size_t len) int" % word
+        candidates.append(
+            {
+                "word": word,
+                "abbr": signature,
+                "info": "".join(signature),
+                "kind": KINDS[n % len(KINDS)],
+                "dup": 1,
+            }
+        )
+    return unpack_candidates(pack_candidates(candidates))
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    value = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del value
+    return size
+
+
+def main():
+    dicts = measure(generate)
+    compact = measure(lambda: PrefixIndex(generate()))
+    print("candidates   %d" % CANDIDATES)
+    print("dicts        %6.1f bytes/candidate" % (dicts / CANDIDATES))
+    print(
+        "PrefixIndex  %6.1f bytes/candidate  (%.1fx smaller)"
+        % (compact / CANDIDATES, dicts / compact)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# SPDX-FileCopyrightText: Copyright 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+# Microbenchmark of reading code completion results through
+# CodeCompletionResults.extract() against the per-chunk CompletionString and
+# CompletionChunk objects it replaces.
+#
+#   python3 hack/benchmark/completion_chunks.py <libclang library file>
+
+import os
+import sys
+import time
+
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(__file__), "../../rplugin/python3/deoplete"),
+)
+
+import clang.cindex as clang  # noqa: E402
+
+RUNS = 5
+
+SOURCE = """#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+#include <pthread.h>
+#include <sys/socket.h>
+#include <netinet/in.h>
+
+int main(void) {
+
+};
+"""
+
+
+def per_chunk(cr):
+    # what the completer did before extract()
+    extracted = []
+    for result in cr.results:
+        cs = result.string
+        typed_text = result_type = placeholder = ""
+        for chunk in [x for x in cs if x.spelling]:
+            if chunk.isKindTypedText():
+                typed_text += chunk.spelling
+                placeholder += chunk.spelling
+            elif chunk.isKindResultType():
+                result_type += chunk.spelling
+            else:
+                placeholder += chunk.spelling
+        extracted.append(
+            (
+                result.cursorKind,
+                cs.priority,
+                cs.availability,
+                typed_text,
+                result_type,
+                placeholder,
+                cs.briefComment,
+            )
+        )
+    return extracted
+
+
+def bulk(cr):
+    return cr.extract()
+
+
+def best(f, cr):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        f(cr)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("usage: completion_chunks.py <libclang library file>")
+        sys.exit(2)
+
+    clang.Config.set_library_file(sys.argv[1])
+    clang.Config.set_compatibility_check(False)
+
+    files = [("cgo_inline.c", SOURCE)]
+    tu = clang.Index.create().parse(
+        "cgo_inline.c", args=["-std=c11"], unsaved_files=files
+    )
+    cr = tu.codeComplete(
+        "cgo_inline.c",
+        SOURCE.count("\n") - 1,
+        1,
+        unsaved_files=files,
+        include_macros=True,
+        include_code_patterns=True,
+        include_brief_comments=True,
+    )
+
+    old = best(per_chunk, cr)
+    new = best(bulk, cr)
+    print("results  %d" % len(cr.results))
+    print("chunks   %8.1f ms" % (old * 1e3))
+    print("extract  %8.1f ms  (%.1fx)" % (new * 1e3, old / new))
+
+    # both paths must agree, apart from the availability wrapper
+    expected = [r[:2] + (str(r[2]),) + r[3:] for r in per_chunk(cr)]
+    got = [r[:2] + (str(clang.availabilityKinds[r[2]]),) + r[3:] for r in bulk(cr)]
+    if expected != got:
+        print("extract() differs from the per-chunk path")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# SPDX-FileCopyrightText: Copyright 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+# Benchmark of parsing a header-heavy preamble with clang modules (-fmodules
+# and a persistent module cache) against the default PARSE_PRECOMPILED_PREAMBLE
+# path. Every parse is a new TranslationUnit in a new Index, like the first
+# completion of a preamble in a new session.
+#
+#   python3 hack/benchmark/modules.py <libclang library file> [<header>...]
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(__file__), "../../rplugin/python3/deoplete"),
+)
+
+import clang.cindex as clang  # noqa: E402
+
+RUNS = 5
+
+HEADERS = [
+    "stdio.h",
+    "stdlib.h",
+    "string.h",
+    "stdint.h",
+    "math.h",
+    "pthread.h",
+    "sys/socket.h",
+    "netinet/in.h",
+]
+
+OPTIONS = (
+    clang.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD
+    | clang.TranslationUnit.PARSE_INCOMPLETE
+    | clang.TranslationUnit.PARSE_PRECOMPILED_PREAMBLE
+    | clang.TranslationUnit.PARSE_CACHE_COMPLETION_RESULTS
+)
+
+
+def source(headers):
+    return "".join("#include <%s>\n" % h for h in headers) + (
+        "\nint main(void) {\nstruct \n};\n"
+    )
+
+
+def measure(args, text):
+    timings = []
+    errors = 0
+    for _ in range(RUNS):
+        index = clang.Index.create()
+        start = time.perf_counter()
+        tu = index.parse(
+            path="cgo_inline.c",
+            args=args,
+            unsaved_files=[("cgo_inline.c", text)],
+            options=OPTIONS,
+        )
+        tu.codeComplete(
+            "cgo_inline.c",
+            text.count("\n") - 1,
+            1,
+            unsaved_files=[("cgo_inline.c", text)],
+        )
+        timings.append(time.perf_counter() - start)
+        errors = sum(d.severity >= clang.Diagnostic.Error for d in tu.diagnostics)
+    return timings, errors
+
+
+def report(name, timings, errors):
+    repeat = sorted(timings[1:])
+    print(
+        "%-10s first %8.1f ms  repeat median %8.1f ms  errors %d"
+        % (name, timings[0] * 1e3, repeat[len(repeat) // 2] * 1e3, errors)
+    )
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("usage: modules.py <libclang library file> [<header>...]")
+        sys.exit(2)
+
+    clang.Config.set_library_file(sys.argv[1])
+    clang.Config.set_compatibility_check(False)
+    text = source(sys.argv[2:] or HEADERS)
+    args = ["-std=c11"]
+
+    report("preamble", *measure(args, text))
+    with tempfile.TemporaryDirectory() as cache:
+        modules = [
+            "-fmodules",
+            "-fimplicit-module-maps",
+            "-fmodules-cache-path=" + cache,
+        ]
+        report("modules", *measure(args + modules, text))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# SPDX-FileCopyrightText: Copyright 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+# Checks that pkg-config resolution gives up close to its deadline, even when
+# pkg-config is a wrapper script whose child hangs (e.g. on a stale NFS mount)
+# and keeps stdout open. Exits 1 when resolve() overruns the deadline.
+#
+#   python3 hack/benchmark/pkgconfig_timeout.py
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(__file__),
+        "../../rplugin/python3/deoplete/source/deoplete_cgo",
+    ),
+)
+
+from pkgconfig import PkgConfig  # noqa: E402
+
+TIMEOUT = 0.5
+SLACK = 0.5
+
+WRAPPER = """#!/bin/sh
+sleep 30
+echo -lhang
+"""
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        binary = os.path.join(tmp, "pkg-config")
+        with open(binary, "w") as f:
+            f.write(WRAPPER)
+        os.chmod(binary, 0o755)
+
+        pkgconfig = PkgConfig(binary, timeout=TIMEOUT)
+        start = time.monotonic()
+        flags = pkgconfig.resolve(["foo", "bar"])
+        elapsed = time.monotonic() - start
+
+    print("resolve  %.2f s (timeout %.1f s), flags %r" % (elapsed, TIMEOUT, flags))
+    for message in pkgconfig.drain_errors():
+        print("  " + message)
+    if elapsed > TIMEOUT + SLACK:
+        print("resolve() overran its deadline")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
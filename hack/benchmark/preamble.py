@@ -0,0 +1,114 @@
+# SPDX-FileCopyrightText: Copyright 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+# Benchmark of the cgo preamble scanner against the previous
+# list.index/reversed-zip implementation on 20k line Go files.
+#
+#   python3 hack/benchmark/preamble.py
+
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(__file__),
+        "../../rplugin/python3/deoplete/source/deoplete_cgo",
+    ),
+)
+
+from preamble import scan_preamble  # noqa: E402
+
+LINES = 20000
+
+HEADER = """package main
+
+/*
+#cgo CFLAGS: -I/usr/local/include
+#cgo pkg-config: gtk+-3.0
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+static int add(int a, int b) {
+	return a + b;
+}
+*/
+import "C"
+
+import (
+	"fmt"
+	"unsafe"
+)
+"""
+
+BODY = """
+func f{n}(s string) int {{
+	cs := C.CString(s)
+	defer C.free(unsafe.Pointer(cs))
+	fmt.Println(s)
+	return int(C.add(C.int(len(s)), {n}))
+}}
+"""
+
+
+def generate(header):
+    lines = header.splitlines()
+    n = 0
+    while len(lines) < LINES:
+        lines += BODY.format(n=n).splitlines()
+        n += 1
+    return lines[:LINES]
+
+
+def legacy_inline_source(buffer):
+    if 'import "C"' not in buffer:
+        return (0, "")
+
+    pos_import_c = list(buffer).index('import "C"')
+    c_inline = buffer[:pos_import_c]
+
+    if c_inline[len(c_inline) - 1] == "*/":
+        comment_start = next(
+            i
+            for i, v in zip(range(len(c_inline) - 1, 0, -1), reversed(c_inline))
+            if v == "/*"
+        )
+        c_inline = c_inline[comment_start + 1 : len(c_inline) - 1]
+
+    cgo_pattern = r"#cgo (\S+): (.+)"
+    for i, line in enumerate(c_inline):
+        if re.match(cgo_pattern, line):
+            del c_inline[i]
+
+    return (len(c_inline), "\n".join(c_inline))
+
+
+def bench(name, func, buffer, number=200):
+    elapsed = min(timeit.repeat(lambda: func(buffer), number=number, repeat=5))
+    per_call = elapsed / number * 1000
+    print("%-32s %8.4f ms" % (name, per_call))
+    return per_call
+
+
+def main():
+    cgo = generate(HEADER)
+    plain = generate(HEADER.replace('import "C"\n', ""))
+
+    print("%d lines per buffer" % LINES)
+    bench("legacy (cgo buffer)", legacy_inline_source, cgo)
+    scanned = bench("scan_preamble (cgo buffer)", scan_preamble, cgo)
+    bench("legacy (non-cgo buffer)", legacy_inline_source, plain)
+    scanned = max(
+        scanned, bench("scan_preamble (non-cgo buffer)", scan_preamble, plain)
+    )
+
+    if scanned >= 1.0:
+        print("scan_preamble exceeded 1 ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# SPDX-FileCopyrightText: Copyright 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+# Startup benchmark of the cgo source: what on_init costs a Go buffer when
+# libclang is loaded eagerly (Config.set_library_file + Index.create, as before)
+# against the deferred path, which only configures it. Each run is a fresh
+# interpreter so the library isn't loaded yet.
+#
+#   python3 hack/benchmark/startup.py <libclang library file>
+
+import os
+import subprocess
+import sys
+
+RUNS = 10
+
+DEOPLETE = os.path.join(os.path.dirname(__file__), "../../rplugin/python3/deoplete")
+
+SCRIPT = """
+import sys, time
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+import clang.cindex as clang
+clang.Config.set_library_file(sys.argv[2])
+clang.Config.set_compatibility_check(False)
+if sys.argv[3] == "eager":
+    clang.Index.create()
+print(time.perf_counter() - start)
+"""
+
+
+def measure(mode, library):
+    timings = []
+    for _ in range(RUNS):
+        output = subprocess.check_output(
+            [sys.executable, "-c", SCRIPT, DEOPLETE, library, mode]
+        )
+        timings.append(float(output))
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("usage: startup.py <libclang library file>")
+        sys.exit(2)
+
+    eager = measure("eager", sys.argv[1])
+    lazy = measure("lazy", sys.argv[1])
+    print("eager  %8.2f ms" % (eager * 1e3))
+    print("lazy   %8.2f ms" % (lazy * 1e3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# SPDX-FileCopyrightText: Copyright 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+# Benchmark of the two codeComplete passes of a completion (column 1 and after
+# "struct "): serially on one TranslationUnit against concurrently on two, one
+# per thread, each with its own Index. The first run parses, the others
+# reparse after an edit of the preamble, like typing in the cgo comment.
+#
+#   python3 hack/benchmark/struct_pass.py <libclang library file> [<header>...]
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(__file__), "../../rplugin/python3/deoplete"),
+)
+
+import clang.cindex as clang  # noqa: E402
+
+RUNS = 5
+
+HEADERS = [
+    "stdio.h",
+    "stdlib.h",
+    "string.h",
+    "stdint.h",
+    "math.h",
+    "pthread.h",
+    "sys/socket.h",
+    "netinet/in.h",
+]
+
+OPTIONS = (
+    clang.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD
+    | clang.TranslationUnit.PARSE_INCOMPLETE
+    | clang.TranslationUnit.PARSE_PRECOMPILED_PREAMBLE
+    | clang.TranslationUnit.PARSE_CACHE_COMPLETION_RESULTS
+)
+
+
+def source(headers, run):
+    return (
+        "".join("#include <%s>\n" % h for h in headers)
+        + "#define EDIT %d\n" % run
+        + "\nint main(void) {\nstruct \n};\n"
+    )
+
+
+class Pass(object):
+    def __init__(self, fname, column):
+        self.index = clang.Index.create()
+        self.fname = fname
+        self.column = column
+        self.tu = None
+
+    def complete(self, text, columns=None):
+        files = [(self.fname, text)]
+        if self.tu is None:
+            self.tu = self.index.parse(
+                path=self.fname, args=["-std=c11"], unsaved_files=files, options=OPTIONS
+            )
+        else:
+            self.tu.reparse(unsaved_files=files)
+        results = []
+        for column in columns or [self.column]:
+            cr = self.tu.codeComplete(
+                self.fname,
+                text.count("\n") - 1,
+                column,
+                unsaved_files=files,
+                include_macros=True,
+                include_code_patterns=True,
+                include_brief_comments=True,
+            )
+            results += cr.extract(("main", "struct", "("))
+        return results
+
+
+def serial(headers):
+    both = Pass("cgo_inline.c", 1)
+    timings = []
+    for run in range(RUNS):
+        text = source(headers, run)
+        start = time.perf_counter()
+        results = both.complete(text, [1, 8])
+        timings.append(time.perf_counter() - start)
+    return timings, len(results)
+
+
+def concurrent(headers):
+    main = Pass("cgo_inline.c", 1)
+    struct = Pass("cgo_inline_struct.c", 8)
+    executor = ThreadPoolExecutor(max_workers=1)
+    timings = []
+    for run in range(RUNS):
+        text = source(headers, run)
+        start = time.perf_counter()
+        struct_pass = executor.submit(struct.complete, text)
+        results = main.complete(text) + struct_pass.result()
+        timings.append(time.perf_counter() - start)
+    executor.shutdown()
+    return timings, len(results)
+
+
+def report(name, timings, results):
+    repeat = sorted(timings[1:])
+    print(
+        "%-10s first %8.1f ms  reparse median %8.1f ms  results %d"
+        % (name, timings[0] * 1e3, repeat[len(repeat) // 2] * 1e3, results)
+    )
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("usage: struct_pass.py <libclang library file> [<header>...]")
+        sys.exit(2)
+
+    clang.Config.set_library_file(sys.argv[1])
+    clang.Config.set_compatibility_check(False)
+    headers = sys.argv[2:] or HEADERS
+
+    report("serial", *serial(headers))
+    report("threads", *concurrent(headers))
+
+
+if __name__ == "__main__":
+    main()
@@ -68,6 +68,7 @@ import clang.enumerations
 
 import os
 import sys
+from types import MappingProxyType
 if sys.version_info[0] == 3:
     # Python 3 strings are unicode, translate them to/from utf8 for C-interop.
     class c_interop_string(c_char_p):
@@ -2608,7 +2609,7 @@ class CompletionString(ClangObject):
 
     @property
     def briefComment(self):
-        if conf.function_exists("clang_getCompletionBriefComment"):
+        if conf.capabilities["clang_getCompletionBriefComment"]:
             return conf.lib.clang_getCompletionBriefComment(self.obj)
         return _CXString()
 
@@ -2681,6 +2682,137 @@ class CodeCompletionResults(ClangObject):
 
         return DiagnosticsItr(self)
 
+    def sort_in_place(self):
+        """
+        Sort the results alphabetically by their typed text, inside libclang.
+        """
+        ccr = self.ptr.contents
+        if ccr.numResults > 0:
+            conf.lib.clang_sortCodeCompletionResults(ccr.results,
+                                                     ccr.numResults)
+
+    def extract(self, skip_spellings=()):
+        """
+        Return a list with one tuple per result:
+
+          (cursorKind, priority, availability, typed text, result type,
+           placeholder text, brief comment)
+
+        The typed text and result type are the concatenations of the chunks of
+        those kinds, the placeholder text the concatenation of every other
+        chunk (typed text included) in order. Chunks spelled as one of
+        skip_spellings are left out.
+
+        This walks all results once through private prototypes of the
+        completion string accessors, without CompletionString and
+        CompletionChunk objects, which is much faster for large result sets.
+        """
+        fn = _completion_functions()
+        num_chunks = fn.num_chunks
+        chunk_kind = fn.chunk_kind
+        chunk_text = fn.chunk_text
+        get_priority = fn.priority
+        get_availability = fn.availability
+        brief_comment = fn.brief_comment
+        get_string = fn.get_string
+        dispose = fn.dispose
+        spellings = SpellingCache
+        skip = frozenset(skip_spellings)
+
+        def text(cxstring):
+            try:
+                value = get_string(cxstring)
+                return value.decode("utf8") if value else ""
+            finally:
+                dispose(cxstring)
+
+        ccr = self.ptr.contents
+        count = ccr.numResults
+        if count <= 0:
+            return []
+        results = (CodeCompletionResult * count).from_address(
+            addressof(ccr.results.contents))
+
+        extracted = []
+        for result in results:
+            cs = result.completionString
+            typed_text = []
+            result_type = []
+            placeholder = []
+            for i in range(num_chunks(cs)):
+                kind = chunk_kind(cs, i)
+                spelling = spellings.get(kind)
+                if spelling is None:
+                    spelling = text(chunk_text(cs, i))
+                if not spelling or spelling in skip:
+                    continue
+                if kind == 1:  # TypedText
+                    typed_text.append(spelling)
+                    placeholder.append(spelling)
+                elif kind == 15:  # ResultType
+                    result_type.append(spelling)
+                else:
+                    placeholder.append(spelling)
+
+            extracted.append((
+                result.cursorKind,
+                get_priority(cs),
+                get_availability(cs),
+                "".join(typed_text),
+                "".join(result_type),
+                "".join(placeholder),
+                text(brief_comment(cs)) if brief_comment is not None else "",
+            ))
+        return extracted
+
+
+class _CXStringValue(Structure):
+    """A CXString that is disposed of explicitly instead of on collection."""
+
+    _fields_ = [("spelling", c_char_p), ("free", c_int)]
+
+
+class _CompletionFunctions(object):
+    """
+    Prototypes of the completion string accessors for
+    CodeCompletionResults.extract(), separate from the registered ones so they
+    return raw values without errcheck conversions.
+    """
+
+    def __init__(self, lib):
+        def function(name, argtypes, restype):
+            # lib[name] makes a new function object, leaving lib.name alone
+            f = lib[name]
+            f.argtypes = argtypes
+            f.restype = restype
+            return f
+
+        self.num_chunks = function(
+            "clang_getNumCompletionChunks", [c_void_p], c_int)
+        self.chunk_kind = function(
+            "clang_getCompletionChunkKind", [c_void_p, c_int], c_int)
+        self.chunk_text = function(
+            "clang_getCompletionChunkText", [c_void_p, c_int], _CXStringValue)
+        self.priority = function(
+            "clang_getCompletionPriority", [c_void_p], c_int)
+        self.availability = function(
+            "clang_getCompletionAvailability", [c_void_p], c_int)
+        self.get_string = function(
+            "clang_getCString", [_CXStringValue], c_char_p)
+        self.dispose = function(
+            "clang_disposeString", [_CXStringValue], None)
+        self.brief_comment = None
+        if conf.capabilities["clang_getCompletionBriefComment"]:
+            self.brief_comment = function(
+                "clang_getCompletionBriefComment", [c_void_p], _CXStringValue)
+
+_completion_functions_cache = []
+
+def _completion_functions():
+    if not _completion_functions_cache:
+        _completion_functions_cache.append(_CompletionFunctions(conf.lib))
+    return _completion_functions_cache[0]
+
 
 class Index(ClangObject):
     """
@@ -3007,8 +3139,10 @@ class TranslationUnit(ClangObject):
                 unsaved_files_array[i].name = b(fspath(name))
                 unsaved_files_array[i].contents = contents
                 unsaved_files_array[i].length = len(contents)
-        ptr = conf.lib.clang_reparseTranslationUnit(self, len(unsaved_files),
+        result = conf.lib.clang_reparseTranslationUnit(self, len(unsaved_files),
                 unsaved_files_array, options)
+        if result != 0:
+            raise TranslationUnitLoadError("Error reparsing translation unit.")
 
     def save(self, filename):
         """Saves the TranslationUnit to a file.
@@ -3527,6 +3661,11 @@ functionList = [
    [Diagnostic],
    c_object_p),
 
+  ("clang_getClangVersion",
+   [],
+   _CXString,
+   _CXString.from_result),
+
   ("clang_getCompletionAvailability",
    [c_void_p],
    c_int),
@@ -3954,6 +4093,9 @@ functionList = [
    [TranslationUnit, c_interop_string, c_uint],
    c_int),
 
+  ("clang_sortCodeCompletionResults",
+   [POINTER(CodeCompletionResult), c_uint]),
+
   ("clang_tokenize",
    [TranslationUnit, SourceRange, POINTER(POINTER(Token)), POINTER(c_uint)]),
 
@@ -4053,6 +4195,20 @@ functionList = [
    c_uint),
 ]
 
+# Functions of functionList that older libclang versions lack, probed once when
+# the library is loaded (see Config.capabilities).
+optionalFunctions = [
+  "clang_CXXMethod_isDefaulted",
+  "clang_CXXRecord_isAbstract",
+  "clang_Cursor_getBriefCommentText",
+  "clang_Cursor_getMangling",
+  "clang_Cursor_getOffsetOfField",
+  "clang_Cursor_isAnonymous",
+  "clang_EnumDecl_isScoped",
+  "clang_getClangVersion",
+  "clang_getCompletionBriefComment",
+]
+
 class LibclangError(Exception):
     def __init__(self, message):
         self.m = message
@@ -4094,6 +4250,31 @@ def register_functions(lib, ignore_errors):
     for f in functionList:
         register(f)
 
+class LazyLibrary(object):
+    """A libclang library instance that registers function prototypes lazily.
+
+    The prototype of a function in functionList is registered the first time
+    the function is looked up, instead of all of them when the library is
+    loaded. Functions missing from the library raise AttributeError on lookup,
+    like the ones skipped by register_functions(lib, ignore_errors=True).
+    """
+
+    def __init__(self, lib):
+        self._lib = lib
+        self._prototypes = dict((item[0], item) for item in functionList)
+
+    def __getattr__(self, name):
+        item = self._prototypes.get(name)
+        if item is not None:
+            register_function(self._lib, item, True)
+        func = getattr(self._lib, name)
+        # found through the instance dict from now on
+        setattr(self, name, func)
+        return func
+
+    def __getitem__(self, name):
+        return self._lib[name]
+
 class Config(object):
     library_path = None
     library_file = None
@@ -4145,10 +4326,30 @@ class Config(object):
     @CachedProperty
     def lib(self):
         lib = self.get_cindex_library()
-        register_functions(lib, not Config.compatibility_check)
+        if Config.compatibility_check:
+            # a missing function must fail here, so register them all
+            register_functions(lib, False)
+        else:
+            lib = LazyLibrary(lib)
         Config.loaded = True
+        self.capabilities = MappingProxyType(
+            dict((name, hasattr(lib, name)) for name in optionalFunctions))
         return lib
 
+    @CachedProperty
+    def capabilities(self):
+        """
+        Read-only {name: available} table of the optionalFunctions in the
+        loaded libclang, probed once when it is loaded. Use it instead of
+        function_exists() on hot paths and to report what a library supports.
+        """
+        # loading the library probes them and shadows this property
+        self.lib
+        return self.capabilities
+
+    def has_capability(self, name):
+        return self.capabilities.get(name, False)
+
     def get_filename(self):
         if Config.library_file:
             return Config.library_file
@@ -3,7 +3,9 @@
 
 import os
 import re
-from typing import Tuple
+import shlex
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from deoplete.base.source import Base
 from deoplete.util import load_external_module, error, getlines
@@ -14,7 +16,20 @@ try:
     import clang.cindex as clang
 
     load_external_module(__file__, "source/deoplete_cgo")
-    from cx_cursor import CXCursor
+    from buffer_tracker import BufferTracker
+    from cache import CandidateCache
+    from candidates import dedupe_candidates, pack_candidates, unpack_candidates
+    from cflags import join_flags, split_flags
+    from completer import Completer
+    from completion_store import CompletionStore
+    from depgraph import DependencyGraph
+    from failure_cache import FailureCache
+    from fingerprint import fingerprint
+    from fsutil import stat_files
+    from pkgconfig import PkgConfig
+    from prefix_index import PrefixIndex
+    from preamble import directive_matches, scan_preamble
+    from worker_pool import WorkerPool
 except ImportError as e:
     raise e
 
@@ -29,14 +44,35 @@ class Source(Base):
         self.input_pattern = r"[^\W\d]*C\."
         self.rank = 500
         self.is_volatile = True
+        # gather_candidates already narrows the candidates to the typed prefix
+        self.matchers = ["matcher_head"]
         self.is_debug_enabled = False
 
         self.cgo_options = dict()
         self.libclang_library_path = None
         self.clang_index = None
-
-        self.cgo_cache = dict()
+        self.completer = None
+        self.completer_options = ()
+        self.completer_lock = threading.Lock()
+        self.worker_pool = None
+        self.preload = False
+        self.preloading = None
+        self.pkgconfig = PkgConfig()
+        self.completion_store = CompletionStore()
+        self.cache_directory = None
+        self.libclang_version = None
+        self.buffer_tracker = BufferTracker(vim, scan_preamble)
+
+        self.cgo_cache = CandidateCache()
+        # candidates dropped before caching
+        self.dedupe_stats = {"empty": 0, "duplicates": 0}
+        self.cgo_headers = DependencyGraph()
+        self.cgo_failures = FailureCache()
         self.cgo_inline_source = None
+        self.cgo_cache_key = None
+
+        self.executor = None
+        self.pending = dict()
 
     def on_init(self, context: UserContext) -> None:
         vars = self.vim.vars
@@ -56,8 +92,30 @@ class Source(Base):
                 },
             ),
             "sort_algo": vars.get("deoplete#sources#cgo#sort_algo", None),
+            "max_candidates": vars.get("deoplete#sources#cgo#max_candidates", 0),
         }
 
+        self.cache_directory = vars.get("deoplete#sources#cgo#cache_directory", "")
+        if self.cache_directory == "":
+            self.cache_directory = os.path.join(
+                self.get_stdpath_cache(), "deoplete-cgo"
+            )
+        self.pkgconfig.load(os.path.join(self.cache_directory, "pkgconfig.json"))
+        self.pkgconfig.timeout = vars.get("deoplete#sources#cgo#pkgconfig_timeout", 2.0)
+        if vars.get("deoplete#sources#cgo#disk_cache", 1):
+            self.completion_store.directory = os.path.join(
+                self.cache_directory, "completion"
+            )
+
+        self.cgo_cache.resize(
+            vars.get("deoplete#sources#cgo#cache_max_entries", 32),
+            vars.get("deoplete#sources#cgo#cache_max_bytes", 64 * 1024 * 1024),
+        )
+        self.cgo_failures.backoff = vars.get("deoplete#sources#cgo#retry_backoff", 1.0)
+        self.cgo_failures.max_backoff = vars.get(
+            "deoplete#sources#cgo#retry_max_backoff", 60.0
+        )
+
         if (
             not clang.Config.loaded
             and clang.Config.library_path != self.libclang_library_path
@@ -65,274 +123,232 @@ class Source(Base):
             clang.Config.set_library_file(self.libclang_library_path)
             clang.Config.set_compatibility_check(False)
 
-        self.clang_index = clang.Index.create()
+        # libclang work runs on background threads; ctypes releases the GIL
+        # during foreign calls, so deoplete keeps running meanwhile
+        ast_directory = None
+        shared_pch = bool(vars.get("deoplete#sources#cgo#shared_pch", 0))
+        if vars.get("deoplete#sources#cgo#ast_cache", 0) or shared_pch:
+            ast_directory = os.path.join(self.cache_directory, "ast")
+        module_directory = None
+        if vars.get("deoplete#sources#cgo#modules", 0):
+            module_directory = os.path.join(self.cache_directory, "modules")
+
+        worker_processes = vars.get("deoplete#sources#cgo#worker_processes", 0)
+        if worker_processes > 0:
+            # parse in child processes, one thread waits on each of them
+            self.worker_pool = WorkerPool(
+                worker_processes,
+                self.libclang_library_path,
+                ast_directory,
+                shared_pch,
+                module_directory,
+            )
+        else:
+            # libclang is loaded by get_completer(), once a buffer has a cgo
+            # preamble
+            self.completer_options = (ast_directory, shared_pch, module_directory)
+        self.preload = bool(vars.get("deoplete#sources#cgo#preload", 1))
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(worker_processes, 1), thread_name_prefix="deoplete-cgo"
+        )
+
+        self.buffer_tracker.enable()
+
+    def get_stdpath_cache(self):
+        if self.vim.call("has", "nvim"):
+            return self.vim.call("stdpath", "cache")
+        return os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
 
     def on_event(self, context: UserContext) -> None:
-        pass
+        # load libclang in the background as soon as a cgo buffer is entered,
+        # rather than on the first "C."
+        if (
+            self.preload
+            and self.preloading is None
+            and context["event"] in ("BufReadPost", "BufEnter", "InsertEnter")
+            and self.executor is not None
+            and self.get_preamble(context) is not None
+        ):
+            self.preloading = self.executor.submit(self.get_libclang_version)
 
     def get_complete_position(self, context: UserContext) -> int:
         m = re.search("(?:" + context["keyword_pattern"] + ")$|$", context["input"])
         return m.start() if m else -1
 
     def gather_candidates(self, context: UserContext) -> Candidates:
-        buffer = getlines(self.vim)
-        return self.cgo_completion(buffer)
+        return self.cgo_completion(context, self.get_preamble(context))
 
-    def cgo_completion(self, buffer) -> Candidates:
-        # No include header
-        if self.get_inline_source(buffer)[0] == 0:
+    def get_preamble(self, context):
+        if self.buffer_tracker.enabled:
+            return self.buffer_tracker.get_preamble(context["bufnr"])
+        return scan_preamble(getlines(self.vim))
+
+    def cgo_completion(self, context, preamble) -> Candidates:
+        context["is_async"] = False
+
+        # No import "C"
+        if preamble is None:
             return
 
-        line_count, inline_source = self.get_inline_source(buffer)
+        self.collect_pending()
 
-        # exists 'self.cgo_inline_source', same inline sources and
-        # already cached cgo complete candidates
-        if (
-            self.cgo_inline_source is not None
-            and self.cgo_inline_source == inline_source
-            and self.cgo_cache[self.cgo_inline_source]
-        ):
-            # Use in-memory(self.cgo_headers) cacahe
-            return self.cgo_cache[self.cgo_inline_source]
-        else:
-            self.cgo_inline_source = inline_source
-            return self.complete(
-                self.clang_index,
-                self.cgo_cache,
-                self.cgo_options,
-                line_count,
-                self.cgo_inline_source,
-            )
+        # drop entries whose included headers changed on disk
+        for key in self.cgo_headers.changed_keys():
+            self.cgo_cache.discard(key)
+            self.cgo_failures.discard(key)
 
-    def get_inline_source(self, buffer) -> Tuple:
-        # TODO(zchee): very slow. about 100ms
+        key = self.get_cache_key(preamble)
+        if self.cgo_failures.blocked(key):
+            # failed recently, wait for its backoff or a change
+            return []
 
-        if 'import "C"' not in buffer:
-            return (0, "")
+        # already cached cgo complete candidates
+        candidates = self.cgo_cache.get(key)
+        if candidates:
+            # Use in-memory(self.cgo_cache) cache, only the ones matching what
+            # was typed after "C."
+            return candidates.match(context.get("complete_str", ""))
+
+        if key not in self.pending:
+            self.pending[key] = self.executor.submit(self.complete, key, preamble)
+
+        # deoplete polls gather_candidates again while is_async is set
+        context["is_async"] = True
+        return []
+
+    def collect_pending(self):
+        # move finished background completions into the cache, on the main
+        # thread so the cache is never touched concurrently
+        for key, future in list(self.pending.items()):
+            if not future.done():
+                continue
+            del self.pending[key]
+            try:
+                candidates, files, empty, duplicates = future.result()
+            except Exception as e:
+                self.cgo_failures.add(key, str(e))
+                self.print_error("cgo completion failed: %s" % e)
+                continue
 
-        pos_import_c = list(buffer).index('import "C"')
-        c_inline = buffer[:pos_import_c]
+            self.cgo_headers.add(key, files)
+            if candidates:
+                self.cgo_failures.discard(key)
+                self.cgo_cache.put(key, PrefixIndex(candidates))
+            else:
+                self.cgo_failures.add(key, "no completion results")
+                self.cgo_cache.discard(key)
+            self.cgo_headers.retain(
+                set(self.cgo_cache.entries) | set(self.cgo_failures.entries)
+            )
+            self.dedupe_stats["empty"] += empty
+            self.dedupe_stats["duplicates"] += duplicates
+            self.debug(
+                "cgo_cache: %s, dropped: %s, failed: %d"
+                % (self.cgo_cache.stats(), self.dedupe_stats, len(self.cgo_failures))
+            )
 
-        if c_inline[len(c_inline) - 1] == "*/":
-            comment_start = next(
-                i
-                for i, v in zip(range(len(c_inline) - 1, 0, -1), reversed(c_inline))
-                if v == "/*"
+        for message in self.pkgconfig.drain_errors():
+            self.print_error(message)
+
+    def get_cache_key(self, preamble):
+        # the raw preamble is usually unchanged between keystrokes, so only
+        # normalize and hash it again when it differs from the last one.
+        # Relative -I flags and quoted includes resolve against the working
+        # directory, which can change with :cd, so it is part of the key.
+        cwd = os.getcwd()
+        inline_source = (preamble.source, preamble.directives, cwd)
+        if inline_source != self.cgo_inline_source:
+            self.cgo_inline_source = inline_source
+            self.cgo_cache_key = fingerprint(
+                preamble.source,
+                ["-std", self.cgo_options["std"]["c"], "-iquote", cwd]
+                + [
+                    "#cgo %s %s: %s" % (constraints, name, " ".join(value.split()))
+                    for name, value, constraints in preamble.directives
+                ],
             )
-            c_inline = c_inline[comment_start + 1 : len(c_inline) - 1]
-            
-        cgo_pattern = r"#cgo (\S+): (.+)"
-        for i, line in enumerate(c_inline):
-            if re.match(cgo_pattern, line):
-                del(c_inline[i])
-
-        return (len(c_inline), "\n".join(c_inline))
-
-    def complete(self, index, cache, cgo_options, line_count, source):
-        cgo_pattern = r"#cgo (\S+): (.+)"
-        flags = set()
-        for key, value in re.findall(cgo_pattern, source):
-            if key == "pkg-config":
-                for flag in self.get_pkgconfig(value.split()):
-                    flags.add(flag)
-            else:
-                if "${SRCDIR}" in key:
-                    key = key.replace("${SRCDIR}", "./")
-                flags.add("%s=%s" % (key, value))
-
-        cgo_flags = ["-std", cgo_options["std"]["c"]] + list(flags)
-
-        fname = "cgo_inline.c"
-        main = """
-int main(void) {
-struct 
-};
-    """
-        template = source + main
-        files = [(fname, template)]
-
-        # clang.TranslationUnit
-        # PARSE_NONE = 0
-        # PARSE_DETAILED_PROCESSING_RECORD = 1
-        # PARSE_INCOMPLETE = 2
-        # PARSE_PRECOMPILED_PREAMBLE = 4
-        # PARSE_CACHE_COMPLETION_RESULTS = 8
-        # PARSE_SKIP_FUNCTION_BODIES = 64
-        # PARSE_INCLUDE_BRIEF_COMMENTS_IN_CODE_COMPLETION = 128
-        options = (
-            clang.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD
-            | clang.TranslationUnit.PARSE_INCOMPLETE
-            | clang.TranslationUnit.PARSE_PRECOMPILED_PREAMBLE
-            | clang.TranslationUnit.PARSE_CACHE_COMPLETION_RESULTS
-        )
+        return self.cgo_cache_key
 
-        tu = index.parse(
-            path=fname, args=cgo_flags, unsaved_files=files, options=options
+    def get_cgo_flags(self, cgo_options, directives):
+        flags = []
+        for name, value, constraints in directives:
+            if not directive_matches(constraints):
+                continue
+            if name == "pkg-config":
+                flags += self.get_pkgconfig(value.split())
+            elif name in ("CFLAGS", "CPPFLAGS"):
+                if "${SRCDIR}" in value:
+                    value = value.replace("${SRCDIR}", "./")
+                flags += shlex.split(value)
+
+        # drop repeated flags, comparing a flag together with its argument so
+        # "-isystem a -isystem b" keeps both
+        cgo_flags = [("-std", cgo_options["std"]["c"])]
+        for flag in split_flags([flag for flag in flags if flag]):
+            if flag not in cgo_flags:
+                cgo_flags.append(flag)
+        return join_flags(cgo_flags)
+
+    def complete(self, key, preamble):
+        cgo_flags = self.get_cgo_flags(self.cgo_options, preamble.directives)
+        sort_algo = self.cgo_options["sort_algo"]
+        max_candidates = self.cgo_options["max_candidates"]
+
+        # shared on-disk cache, valid while the included headers are unchanged
+        version = self.get_libclang_version()
+        store_key = self.completion_store.key(
+            key,
+            cgo_flags + [str(sort_algo), str(max_candidates), os.getcwd()],
+            version,
         )
+        stored = self.completion_store.load(store_key, version)
+        if stored is not None:
+            records, files = stored
+            return unpack_candidates(records), files, 0, 0
+
+        if self.worker_pool is not None:
+            candidates, includes = self.worker_pool.complete(
+                key,
+                preamble.source,
+                preamble.line_count,
+                cgo_flags,
+                sort_algo,
+                max_candidates,
+            )
+        else:
+            candidates, includes = self.get_completer().complete(
+                preamble.source,
+                preamble.line_count,
+                cgo_flags,
+                sort_algo,
+                max_candidates,
+            )
 
-        cr = tu.codeComplete(
-            path=fname,
-            line=(line_count + 2),
-            column=1,
-            unsaved_files=files,
-            include_macros=True,
-            include_code_patterns=True,
-            include_brief_comments=True,
-        )
-        cr_struct = tu.codeComplete(
-            path=fname,
-            line=(line_count + 2),
-            column=8,
-            unsaved_files=files,
-            include_macros=True,
-            include_code_patterns=True,
-            include_brief_comments=True,
-        )
+        candidates, empty, duplicates = dedupe_candidates(candidates)
 
-        if cr is None or cr_struct is None:
-            return []
-        results = cr.results
-        struct_results = cr_struct.results
-        if cgo_options["sort_algo"] == "priority":
-            results = sorted(cr.results, key=self.get_priority)
-            struct_results = sorted(cr_struct.results, key=self.get_priority)
-        elif cgo_options["sort_algo"] == "alphabetical":
-            results = sorted(cr.results, key=self.get_abbrevation)
-            struct_results = sorted(cr_struct.results, key=self.get_abbrevation)
-
-        cache[source] = [
-            {
-                "word": "CString",
-                "abbr": "CString(string) *C.char",
-                "info": "CString(string) *C.char",
-                "kind": "function",
-                "dup": 1,
-            },
-            {
-                "word": "CBytes",
-                "abbr": "CBytes([]byte) unsafe.Pointer",
-                "info": "CBytes([]byte) unsafe.Pointer",
-                "kind": "function",
-                "dup": 1,
-            },
-            {
-                "word": "GoString",
-                "abbr": "GoString(*C.char) string",
-                "info": "GoString(*C.char) string",
-                "kind": "function",
-                "dup": 1,
-            },
-            {
-                "word": "GoStringN",
-                "abbr": "GoStringN(*C.char, C.int) string",
-                "info": "GoStringN(*C.char, C.int) string",
-                "kind": "function",
-                "dup": 1,
-            },
-            {
-                "word": "GoBytes",
-                "abbr": "GoBytes(unsafe.Pointer, C.int) []byte",
-                "info": "GoBytes(unsafe.Pointer, C.int) []byte",
-                "kind": "function",
-                "dup": 1,
-            },
-        ]
-
-        cache[source] += list(map(self.parse_candidates, results))
-        cache[source] += list(map(self.parse_candidates, struct_results))
-
-        return cache[source]
-
-    def get_priority(self, x):
-        return x.string.priority
-
-    def get_abbr(self, strings):
-        for chunks in strings:
-            if chunks.isKindTypedText():
-                return chunks.spelling
-        return ""
-
-    def get_abbrevation(self, x):
-        return self.get_abbr(x.string).lower()
-
-    def parse_candidates(self, result):
-        completion = {"dup": 1, "word": ""}
-        _type = ""
-        word = ""
-        placeholder = ""
-        sep = " "
-
-        for chunk in [x for x in result.string if x.spelling]:
-            chunk_spelling = chunk.spelling
-            # ignore inline fake main(void), and meaningless spellings
-            if (
-                chunk_spelling is None
-                or chunk_spelling == "main"
-                or chunk_spelling == "struct"
-                or chunk_spelling == "("
-            ):
-                continue
+        files = stat_files(includes)
+        if candidates:
+            self.completion_store.save(
+                store_key, version, pack_candidates(candidates), files
+            )
+        return candidates, files, empty, duplicates
 
-            if chunk.isKindTypedText():
-                word += chunk_spelling
-                placeholder += chunk_spelling
-            elif chunk.isKindResultType():
-                _type += chunk_spelling
+    def get_libclang_version(self):
+        if self.libclang_version is None:
+            if self.worker_pool is not None:
+                self.libclang_version = self.worker_pool.version()
             else:
-                placeholder += chunk_spelling
-
-        if not word:
-            # early return
-            return completion
-
-        abbr = completion["info"] = placeholder + sep + _type
-
-        if result.kind == clang.CursorKind.STRUCT_DECL:
-            completion["word"] = "struct_" + word
-            completion["abbr"] = "struct_" + abbr
-        elif result.kind == clang.CursorKind.UNION_DECL:
-            completion["word"] = "union_" + word
-            completion["abbr"] = "union_" + abbr
-        elif result.kind == clang.CursorKind.ENUM_CONSTANT_DECL:
-            completion["word"] = "enum_" + word
-            completion["abbr"] = "enum_" + abbr
-        else:
-            completion["word"] = word
-            completion["abbr"] = abbr
-
-        completion["kind"] = " ".join(
-            [
-                (
-                    CXCursor.kinds[result.cursorKind]
-                    if (result.cursorKind in CXCursor.kinds)
-                    else str(result.cursorKind)
-                )
-            ]
-        )
-
-        return completion
+                self.libclang_version = self.get_completer().version()
+        return self.libclang_version
+
+    def get_completer(self):
+        # dlopens libclang on first use, from an executor thread
+        with self.completer_lock:
+            if self.completer is None:
+                self.clang_index = clang.Index.create()
+                self.completer = Completer(self.clang_index, *self.completer_options)
+                self.debug("libclang: %s" % dict(clang.conf.capabilities))
+        return self.completer
 
     def get_pkgconfig(self, packages):
-        out = []
-        pkgconfig = self.find_binary_path("pkg-config")
-        if pkgconfig != "":
-            for pkg in packages:
-                flag = os.popen(pkgconfig + " " + pkg + " --cflags --libs").read()
-                out += flag.rstrip().split(" ")
-        return out
-
-    def find_binary_path(self, path):
-        def is_exec(bin_path):
-            return os.path.isfile(bin_path) and os.access(bin_path, os.X_OK)
-
-        dirpath, binary = os.path.split(path)
-        if dirpath:
-            if is_exec(path):
-                return path
-        else:
-            for p in os.environ["PATH"].split(os.pathsep):
-                p = p.strip('"')
-                binary = os.path.join(p, path)
-                if is_exec(binary):
-                    return binary
-        return self.print_error(path + " binary not found")
+        return self.pkgconfig.resolve(packages)
@@ -0,0 +1,237 @@
+# SPDX-FileCopyrightText: 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+import hashlib
+import json
+import os
+import platform
+import re
+import tempfile
+
+from cflags import join_flags, split_flags
+from fsutil import file_stamp, write_json_atomic
+
+# bump when the on-disk format changes
+STORE_VERSION = 1
+
+prefix_directives = ("#include", "#import", "#define", "#undef")
+
+# C11 and common POSIX headers, resolved from the default system paths whatever
+# the -I flags of a preamble are, so a precompiled prefix of them is shareable
+standard_headers = frozenset(
+    [
+        "assert.h",
+        "complex.h",
+        "ctype.h",
+        "errno.h",
+        "fenv.h",
+        "float.h",
+        "inttypes.h",
+        "iso646.h",
+        "limits.h",
+        "locale.h",
+        "math.h",
+        "setjmp.h",
+        "signal.h",
+        "stdalign.h",
+        "stdarg.h",
+        "stdatomic.h",
+        "stdbool.h",
+        "stddef.h",
+        "stdint.h",
+        "stdio.h",
+        "stdlib.h",
+        "stdnoreturn.h",
+        "string.h",
+        "tgmath.h",
+        "threads.h",
+        "time.h",
+        "uchar.h",
+        "wchar.h",
+        "wctype.h",
+        "arpa/inet.h",
+        "dirent.h",
+        "dlfcn.h",
+        "fcntl.h",
+        "netdb.h",
+        "netinet/in.h",
+        "poll.h",
+        "pthread.h",
+        "strings.h",
+        "sys/mman.h",
+        "sys/socket.h",
+        "sys/stat.h",
+        "sys/time.h",
+        "sys/types.h",
+        "sys/wait.h",
+        "termios.h",
+        "unistd.h",
+    ]
+)
+
+system_include_pattern = re.compile(r"#\s*include\s*<([^>]+)>\s*$")
+
+# Flags a precompiled header must agree on with the TU that includes it, or
+# that change which standard headers are found: flags with an argument by name,
+# then single tokens by name and by prefix.
+pch_argument_flags = frozenset(
+    ["-D", "-U", "-std", "-target", "--target", "-isysroot", "--sysroot"]
+)
+pch_single_flags = frozenset(
+    ["-ansi", "-nobuiltininc", "-nostdinc", "-nostdlibinc", "-pthread"]
+)
+pch_flag_prefixes = (
+    "-D",
+    "-U",
+    "-std=",
+    "--target=",
+    "-isysroot",
+    "--sysroot=",
+    "-O",
+    "-m",
+    "-f",
+)
+# linker flags among those prefixes
+pch_excluded_prefixes = ("-fuse-ld=",)
+
+
+def split_include_block(source):
+    # Splits the preamble into its leading block of '#include' (and '#define')
+    # lines and the rest. The rest keeps blank lines in place of the block so
+    # line numbers don't move.
+    lines = source.split("\n")
+    end = 0
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if not stripped.startswith(prefix_directives) or stripped.endswith("\\"):
+            break
+        end = i + 1
+    else:
+        end = len(lines)
+
+    block = "\n".join(lines[:end])
+    if not block.strip():
+        return "", source
+    return block, "\n".join([""] * end + lines[end:])
+
+
+def split_system_prefix(source):
+    # Like split_include_block, but the block is only the leading run of
+    # standard headers (and the #define lines among them), which most preambles
+    # share.
+    lines = source.split("\n")
+    end = 0
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        m = system_include_pattern.match(stripped)
+        if m is not None and m.group(1) in standard_headers:
+            end = i + 1
+            continue
+        if not stripped.startswith(("#define", "#undef")) or stripped.endswith("\\"):
+            break
+
+    if end == 0:
+        return "", source
+    return "\n".join(lines[:end]), "\n".join([""] * end + lines[end:])
+
+
+def pch_flags(cgo_flags):
+    # The subset of the compile args that changes what a standard-header PCH
+    # contains; include paths and linker flags don't.
+    flags = []
+    for flag in split_flags(cgo_flags):
+        if len(flag) == 2:
+            keep = flag[0] in pch_argument_flags
+        else:
+            keep = flag[0] in pch_single_flags or (
+                flag[0].startswith(pch_flag_prefixes)
+                and not flag[0].startswith(pch_excluded_prefixes)
+            )
+        if keep:
+            flags.append(flag)
+    return join_flags(flags)
+
+
+def pch_target():
+    # keeps targets apart in a cache directory shared between machines
+    return "%s-%s" % (platform.machine(), platform.system())
+
+
+class AstStore(object):
+    # Saved ASTs of preamble include blocks, built with TranslationUnit.save()
+    # and valid while the headers they were built from are unchanged. They are
+    # fed back to libclang with -include-pch, so a new session or a different
+    # preamble with the same includes doesn't parse those headers from source.
+    #
+    # <directory>/v<STORE_VERSION>/<key[:2]>/<key>.{h,ast,json}
+    #
+    # The include block is written to the .h file and parsed from there, since
+    # the saved AST refers to its input file by path.
+
+    def __init__(self, directory=None):
+        self.directory = directory
+
+    def key(self, block, cgo_flags, version):
+        h = hashlib.blake2b(digest_size=16)
+        for part in [block, version] + list(cgo_flags):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def path(self, key, ext=".ast"):
+        return os.path.join(self.directory, "v%d" % STORE_VERSION, key[:2], key + ext)
+
+    def lookup(self, key):
+        if self.directory is None:
+            return None
+        try:
+            with open(self.path(key, ".json")) as f:
+                files = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        for header, stamp in files.items():
+            if file_stamp(header) != stamp:
+                return None
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        return path
+
+    def write_header(self, key, block):
+        path = self.path(key, ".h")
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+            with os.fdopen(fd, "w") as f:
+                f.write(block + "\n")
+            os.replace(tmp, path)
+        return path
+
+    def save(self, key, tu, files):
+        path = self.path(key)
+        dirname = os.path.dirname(path)
+        fd, tmp = tempfile.mkstemp(dir=dirname, prefix=".tmp-", suffix=".ast")
+        os.close(fd)
+        try:
+            tu.save(tmp)
+            os.replace(tmp, path)
+        except Exception:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        write_json_atomic(self.path(key, ".json"), files)
+        return path
+
+    def discard(self, key):
+        for ext in (".ast", ".json"):
+            try:
+                os.unlink(self.path(key, ext))
+            except OSError:
+                pass
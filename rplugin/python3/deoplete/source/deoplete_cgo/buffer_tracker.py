@@ -0,0 +1,161 @@
+# SPDX-FileCopyrightText: 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+# The on_lines callback runs inside nvim and only records edits that start at
+# or above the watched line (the 'import "C"' line). Edits in the Go body return
+# immediately, so typing there costs nothing on the completion path.
+#
+# Per buffer it keeps:
+#   limit -- 0-based index of the watched line, shifted by edits above it
+#   first -- first changed line since the last drain, or -1
+#   delta -- number of lines inserted (or removed) above the watched line
+#   whole -- the watched line itself was touched, a full rescan is needed
+LUA_ATTACH = """
+local bufnr = ...
+_G.deoplete_cgo_buffers = _G.deoplete_cgo_buffers or {}
+local buffers = _G.deoplete_cgo_buffers
+if buffers[bufnr] ~= nil then
+  return true
+end
+local ok = vim.api.nvim_buf_attach(bufnr, false, {
+  on_lines = function(_, buf, _, firstline, lastline, new_lastline)
+    local state = buffers[buf]
+    if state == nil then
+      return true
+    end
+    if firstline > state.limit then
+      return
+    end
+    if state.first < 0 or firstline < state.first then
+      state.first = firstline
+    end
+    if lastline > state.limit then
+      state.whole = true
+      state.limit = math.huge
+    else
+      state.delta = state.delta + new_lastline - lastline
+      state.limit = state.limit + new_lastline - lastline
+    end
+  end,
+  on_reload = function(_, buf)
+    local state = buffers[buf]
+    if state ~= nil then
+      state.first = 0
+      state.whole = true
+      state.limit = math.huge
+    end
+  end,
+  on_detach = function(_, buf)
+    buffers[buf] = nil
+  end,
+})
+if ok then
+  buffers[bufnr] = {limit = math.huge, first = -1, delta = 0, whole = false}
+end
+return ok
+"""
+
+LUA_DRAIN = """
+local bufnr = ...
+local state = (_G.deoplete_cgo_buffers or {})[bufnr]
+if state == nil then
+  return nil
+end
+local changes = {first = state.first, delta = state.delta, whole = state.whole}
+state.first = -1
+state.delta = 0
+state.whole = false
+return changes
+"""
+
+LUA_WATCH = """
+local bufnr, limit = ...
+local state = (_G.deoplete_cgo_buffers or {})[bufnr]
+if state ~= nil then
+  state.limit = limit < 0 and math.huge or limit
+end
+"""
+
+
+class BufferState(object):
+    def __init__(self):
+        # 0-based index of the 'import "C"' line, None for non-cgo buffers
+        self.import_line = None
+        self.line_hashes = []
+        self.preamble = None
+
+
+class BufferTracker(object):
+    # Per-buffer model of the cgo preamble, kept up to date from nvim_buf_attach
+    # on_lines events instead of rescanning the whole buffer on every request.
+
+    def __init__(self, vim, scan):
+        self.vim = vim
+        self.scan = scan
+        self.enabled = False
+        self.buffers = dict()
+
+    def enable(self):
+        try:
+            self.enabled = bool(self.vim.call("has", "nvim-0.5"))
+        except Exception:
+            self.enabled = False
+
+    def get_preamble(self, bufnr):
+        state = self.buffers.get(bufnr)
+        changes = None
+        if state is not None:
+            changes = self.vim.exec_lua(LUA_DRAIN, bufnr)
+            if changes is None:
+                # detached (buffer unloaded or reloaded), attach again
+                del self.buffers[bufnr]
+                state = None
+
+        if state is None:
+            if not self.vim.exec_lua(LUA_ATTACH, bufnr):
+                # can't follow this buffer, scan it every time
+                return self.scan(self.vim.api.buf_get_lines(bufnr, 0, -1, False))
+            state = self.buffers[bufnr] = BufferState()
+            self.rescan(bufnr, state)
+        elif changes["first"] >= 0:
+            if changes["whole"] or state.import_line is None:
+                self.rescan(bufnr, state)
+            else:
+                self.update(bufnr, state, state.import_line + changes["delta"])
+
+        return state.preamble
+
+    def update(self, bufnr, state, import_line):
+        # only the lines up to and including 'import "C"' can change the
+        # preamble, and the import line itself was not touched
+        lines = self.vim.api.buf_get_lines(bufnr, 0, import_line + 1, False)
+        line_hashes = [hash(line) for line in lines]
+        if line_hashes == state.line_hashes:
+            state.import_line = import_line
+            self.vim.exec_lua(LUA_WATCH, bufnr, import_line)
+            return
+
+        preamble = self.scan(lines)
+        if preamble is None or preamble.import_line != import_line:
+            return self.rescan(bufnr, state)
+
+        self.watch(bufnr, state, preamble, line_hashes)
+
+    def rescan(self, bufnr, state):
+        lines = self.vim.api.buf_get_lines(bufnr, 0, -1, False)
+        preamble = self.scan(lines)
+        if preamble is None:
+            state.import_line = None
+            state.line_hashes = []
+            state.preamble = None
+            self.vim.exec_lua(LUA_WATCH, bufnr, -1)
+            return
+
+        line_hashes = [hash(line) for line in lines[: preamble.import_line + 1]]
+        self.watch(bufnr, state, preamble, line_hashes)
+
+    def watch(self, bufnr, state, preamble, line_hashes):
+        state.import_line = preamble.import_line
+        state.line_hashes = line_hashes
+        state.preamble = preamble
+        self.vim.exec_lua(LUA_WATCH, bufnr, preamble.import_line)
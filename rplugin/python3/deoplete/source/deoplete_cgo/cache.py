@@ -0,0 +1,102 @@
+# SPDX-FileCopyrightText: 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+import sys
+from collections import OrderedDict
+
+# rough CPython overheads, used to account cached candidates without walking
+# them with sys.getsizeof on every insert
+DICT_OVERHEAD = sys.getsizeof({"word": "", "abbr": "", "info": "", "kind": ""})
+STR_OVERHEAD = sys.getsizeof("")
+
+
+def approximate_size(key, candidates):
+    size = STR_OVERHEAD + len(key)
+    if hasattr(candidates, "approximate_size"):
+        # compact entries (PrefixIndex) account for themselves
+        return size + candidates.approximate_size()
+    for candidate in candidates:
+        size += DICT_OVERHEAD
+        for value in candidate.values():
+            if isinstance(value, str):
+                size += STR_OVERHEAD + len(value)
+    return size
+
+
+class CandidateCache(object):
+    # LRU cache of completion candidates bounded by both the number of entries
+    # and the approximate number of bytes they hold.
+
+    def __init__(self, max_entries=32, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.entries = OrderedDict()
+        self.sizes = dict()
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        if key not in self.entries:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, candidates):
+        if key in self.entries:
+            self.remove(key)
+
+        size = approximate_size(key, candidates)
+        self.entries[key] = candidates
+        self.sizes[key] = size
+        self.total_bytes += size
+
+        self.evict()
+
+    def remove(self, key):
+        del self.entries[key]
+        self.total_bytes -= self.sizes.pop(key)
+
+    def discard(self, key):
+        if key in self.entries:
+            self.remove(key)
+
+    def evict(self):
+        # always keep the most recent entry, even if it alone exceeds max_bytes
+        while len(self.entries) > 1 and (
+            len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes
+        ):
+            key = next(iter(self.entries))
+            self.remove(key)
+            self.evictions += 1
+
+    def resize(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict()
+
+    def clear(self):
+        self.entries.clear()
+        self.sizes.clear()
+        self.total_bytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,43 @@
+# SPDX-FileCopyrightText: 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+# Candidates cross process and disk boundaries as compact
+# (word, abbr, info, kind) records.
+
+
+def pack_candidates(candidates):
+    return [
+        (c["word"], c.get("abbr", ""), c.get("info", ""), c.get("kind", ""))
+        for c in candidates
+    ]
+
+
+def unpack_candidates(records):
+    candidates = []
+    for word, abbr, info, kind in records:
+        if not word:
+            candidates.append({"dup": 1, "word": ""})
+            continue
+        candidates.append(
+            {"word": word, "abbr": abbr, "info": info, "kind": kind, "dup": 1}
+        )
+    return candidates
+
+
+def dedupe_candidates(candidates):
+    # Drops the empty candidates and the ones repeated with the same word, kind
+    # and signature (e.g. seen by both completion contexts). Returns the unique
+    # candidates in their order and the number of empty and duplicate ones.
+    seen = set()
+    unique = []
+    empty = 0
+    for c in candidates:
+        if not c["word"]:
+            empty += 1
+            continue
+        key = (c["word"], c.get("kind", ""), c.get("abbr", ""))
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(c)
+    return unique, empty, len(candidates) - len(unique) - empty
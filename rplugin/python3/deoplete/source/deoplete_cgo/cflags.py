@@ -0,0 +1,57 @@
+# SPDX-FileCopyrightText: 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+# compiler and linker flags whose argument may be the next token
+flags_with_argument = frozenset(
+    [
+        "-D",
+        "-F",
+        "-I",
+        "-L",
+        "-MF",
+        "-MQ",
+        "-MT",
+        "-U",
+        "-Xclang",
+        "-Xlinker",
+        "-Xpreprocessor",
+        "-arch",
+        "-framework",
+        "-idirafter",
+        "-iframework",
+        "-imacros",
+        "-include",
+        "-include-pch",
+        "-iprefix",
+        "-iquote",
+        "-isysroot",
+        "-isystem",
+        "-iwithprefix",
+        "-l",
+        "-mllvm",
+        "-o",
+        "-std",
+        "-target",
+        "-x",
+        "--sysroot",
+        "--target",
+    ]
+)
+
+
+def split_flags(args):
+    # Groups command line tokens into (flag,) and (flag, argument) tuples.
+    flags = []
+    i = 0
+    while i < len(args):
+        if args[i] in flags_with_argument and i + 1 < len(args):
+            flags.append((args[i], args[i + 1]))
+            i += 2
+        else:
+            flags.append((args[i],))
+            i += 1
+    return flags
+
+
+def join_flags(flags):
+    return [token for flag in flags for token in flag]
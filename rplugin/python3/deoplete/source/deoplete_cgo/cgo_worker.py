@@ -0,0 +1,56 @@
+# SPDX-FileCopyrightText: 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+# Entry point of the out-of-process libclang worker started by WorkerPool.
+#
+#   python3 cgo_worker.py <libclang library file> \
+#       [<AST store directory> [<shared PCH> [<module cache directory>]]]
+
+import os
+import sys
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path[0:0] = [here, os.path.normpath(os.path.join(here, "..", ".."))]
+
+    import clang.cindex as clang
+    from candidates import pack_candidates
+    from completer import Completer
+    from worker_pool import read_message, write_message
+
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    # keep stray prints from corrupting the protocol
+    sys.stdout = sys.stderr
+
+    clang.Config.set_library_file(sys.argv[1])
+    clang.Config.set_compatibility_check(False)
+    ast_directory = sys.argv[2] if len(sys.argv) > 2 and sys.argv[2] else None
+    shared_pch = len(sys.argv) > 3 and sys.argv[3] == "1"
+    module_directory = sys.argv[4] if len(sys.argv) > 4 and sys.argv[4] else None
+    completer = Completer(
+        clang.Index.create(), ast_directory, shared_pch, module_directory
+    )
+
+    while True:
+        message = read_message(stdin)
+        if message is None:
+            break
+
+        try:
+            if message[0] == "complete":
+                candidates, includes = completer.complete(*message[1:])
+                response = ("ok", (pack_candidates(candidates), includes))
+            elif message[0] == "version":
+                response = ("ok", completer.version())
+            else:
+                response = ("error", "unknown request %r" % (message[0],))
+        except Exception as e:
+            response = ("error", "%s: %s" % (type(e).__name__, e))
+
+        write_message(stdout, response)
+
+
+if __name__ == "__main__":
+    main()
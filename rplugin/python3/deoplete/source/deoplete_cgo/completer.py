@@ -0,0 +1,371 @@
+# SPDX-FileCopyrightText: 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import clang.cindex as clang
+
+from ast_store import (
+    AstStore,
+    pch_flags,
+    pch_target,
+    split_include_block,
+    split_system_prefix,
+)
+from cx_cursor import CXCursor
+from fsutil import file_stamp, stat_files
+from ranking import merge, rank
+from tu_pool import TUPool, include_set
+
+skip_spellings = ("main", "struct", "(")
+
+inline_main = """
+int main(void) {
+struct 
+};
+    """
+
+# clang's diagnostics for headers that don't build or load as modules
+module_failure_pattern = re.compile(
+    r"^(could not build module '|could not load module '|module '[^']*' not found"
+    r"|could not find module '|error in module map|parse error in module map)"
+)
+
+
+class Completer(object):
+    # Owns the libclang side of completion: one Index, the live
+    # TranslationUnits and the conversion of results to candidates. It runs in
+    # the deoplete process or inside a cgo_worker process.
+    #
+    # The struct tag pass has its own Index, TUPool and file name and runs on
+    # struct_executor alongside the main pass, so a TU is never used from two
+    # threads. lock guards the AST store bookkeeping they share.
+
+    def __init__(
+        self, index, ast_directory=None, shared_pch=False, module_directory=None
+    ):
+        self.index = index
+        self.tu_pool = TUPool()
+        self.struct_index = clang.Index.create()
+        self.struct_tu_pool = TUPool()
+        self.struct_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="cgo-struct"
+        )
+        self.lock = threading.Lock()
+        self.ast_store = AstStore(ast_directory)
+        self.shared_pch = shared_pch
+        self.ast_loaded = set()
+        # AST keys whose header failed to build -> stamps of what it included
+        self.ast_failures = dict()
+        self.module_directory = module_directory
+        # include sets whose headers don't build as modules
+        self.module_failures = set()
+
+    def complete(self, source, line_count, cgo_flags, sort_algo, max_candidates=0):
+        # clang.TranslationUnit
+        # PARSE_NONE = 0
+        # PARSE_DETAILED_PROCESSING_RECORD = 1
+        # PARSE_INCOMPLETE = 2
+        # PARSE_PRECOMPILED_PREAMBLE = 4
+        # PARSE_CACHE_COMPLETION_RESULTS = 8
+        # PARSE_SKIP_FUNCTION_BODIES = 64
+        # PARSE_INCLUDE_BRIEF_COMMENTS_IN_CODE_COMPLETION = 128
+        options = (
+            clang.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD
+            | clang.TranslationUnit.PARSE_INCOMPLETE
+            | clang.TranslationUnit.PARSE_PRECOMPILED_PREAMBLE
+            | clang.TranslationUnit.PARSE_CACHE_COMPLETION_RESULTS
+        )
+
+        # ordinary identifiers, macros and keywords at column 1, struct tags
+        # after "struct " (C tags are a separate namespace), both at once
+        struct_pass = self.struct_executor.submit(
+            self.complete_at,
+            self.struct_index,
+            self.struct_tu_pool,
+            "cgo_inline_struct.c",
+            source,
+            line_count,
+            cgo_flags,
+            options,
+            8,
+        )
+        try:
+            # sorted inside libclang, only the struct tags are sorted here
+            results, includes = self.complete_at(
+                self.index,
+                self.tu_pool,
+                "cgo_inline.c",
+                source,
+                line_count,
+                cgo_flags,
+                options,
+                1,
+                sort_algo == "alphabetical",
+            )
+        finally:
+            # never leave the struct pass running into the next request
+            wait([struct_pass])
+        struct_results, _ = struct_pass.result()
+
+        if results is None or struct_results is None:
+            return [], includes
+        if sort_algo == "alphabetical":
+            results = merge(results, struct_results, sort_algo, max_candidates)
+        else:
+            results = rank(results + struct_results, sort_algo, max_candidates)
+
+        candidates = [
+            {
+                "word": "CString",
+                "abbr": "CString(string) *C.char",
+                "info": "CString(string) *C.char",
+                "kind": "function",
+                "dup": 1,
+            },
+            {
+                "word": "CBytes",
+                "abbr": "CBytes([]byte) unsafe.Pointer",
+                "info": "CBytes([]byte) unsafe.Pointer",
+                "kind": "function",
+                "dup": 1,
+            },
+            {
+                "word": "GoString",
+                "abbr": "GoString(*C.char) string",
+                "info": "GoString(*C.char) string",
+                "kind": "function",
+                "dup": 1,
+            },
+            {
+                "word": "GoStringN",
+                "abbr": "GoStringN(*C.char, C.int) string",
+                "info": "GoStringN(*C.char, C.int) string",
+                "kind": "function",
+                "dup": 1,
+            },
+            {
+                "word": "GoBytes",
+                "abbr": "GoBytes(unsafe.Pointer, C.int) []byte",
+                "info": "GoBytes(unsafe.Pointer, C.int) []byte",
+                "kind": "function",
+                "dup": 1,
+            },
+        ]
+
+        candidates += list(map(self.parse_candidates, results))
+
+        return candidates, includes
+
+    def complete_at(
+        self,
+        index,
+        tu_pool,
+        fname,
+        source,
+        line_count,
+        cgo_flags,
+        options,
+        column,
+        sort=False,
+    ):
+        # one codeComplete pass, returns its CodeCompletionResults.extract()
+        # tuples without the inline fake main(void) and meaningless spellings
+        tu, files = self.parse(index, tu_pool, fname, cgo_flags, source, options)
+        cr = tu.codeComplete(
+            path=fname,
+            line=(line_count + 2),
+            column=column,
+            unsaved_files=files,
+            include_macros=True,
+            include_code_patterns=True,
+            include_brief_comments=True,
+        )
+
+        includes = self.get_includes(tu)
+
+        if cr is None:
+            return None, includes
+        if sort:
+            cr.sort_in_place()
+        return cr.extract(skip_spellings), includes
+
+    def parse(self, index, tu_pool, fname, cgo_flags, source, options):
+        # Parses the include block from a saved AST (-include-pch) when one is
+        # available, and the preamble from source otherwise. The live
+        # TranslationUnit is reused for the same args and includes.
+        #
+        # In modules mode the headers are imported as clang modules from the
+        # module cache instead; preambles whose headers fail to build as
+        # modules fall back to the other paths.
+        #
+        # With shared_pch the saved block is only the leading standard headers,
+        # built with the args that matter to them, so one AST serves every
+        # preamble starting with the same headers whatever else they include.
+        if self.module_directory is not None:
+            includes = include_set(source)
+            if includes not in self.module_failures:
+                args = cgo_flags + self.module_flags()
+                files = [(fname, source + inline_main)]
+                tu = tu_pool.acquire(index, fname, args, source, files, options)
+                if not self.is_module_failure(tu):
+                    return tu, files
+                self.module_failures.add(includes)
+                tu_pool.discard(args, source)
+
+        if self.shared_pch:
+            block, rest = split_system_prefix(source)
+        else:
+            block, rest = split_include_block(source)
+        if self.ast_store.directory is not None and block:
+            if self.shared_pch:
+                flags = pch_flags(cgo_flags)
+                key_flags = flags + [pch_target()]
+            else:
+                # the header lives in the store, so quoted includes must still
+                # be searched relative to the working directory like
+                # cgo_inline.c
+                flags = key_flags = cgo_flags + ["-iquote", os.getcwd()]
+            # the other pass waits here rather than building the same AST
+            with self.lock:
+                ast = self.get_ast(index, block, flags, key_flags)
+            if ast is not None:
+                files = [(fname, rest + inline_main)]
+                tu = tu_pool.acquire(
+                    index,
+                    fname,
+                    cgo_flags + ["-include-pch", ast],
+                    rest,
+                    files,
+                    options,
+                )
+                if not self.is_stale_pch(tu):
+                    return tu, files
+
+        files = [(fname, source + inline_main)]
+        tu = tu_pool.acquire(index, fname, cgo_flags, source, files, options)
+        return tu, files
+
+    def get_ast(self, index, block, cgo_flags, key_flags):
+        key = self.ast_store.key(block, key_flags, self.version())
+        ast = self.ast_store.lookup(key)
+        if ast is not None and ast not in self.ast_loaded:
+            # make sure this libclang can load it before relying on it
+            try:
+                index.read(ast)
+                self.ast_loaded.add(ast)
+            except clang.TranslationUnitLoadError:
+                ast = None
+        if ast is None:
+            if self.ast_build_failed(key):
+                return None
+            ast = self.build_ast(index, key, block, cgo_flags)
+        return ast
+
+    def ast_build_failed(self, key):
+        # a failed header isn't built again while what it included is unchanged
+        files = self.ast_failures.get(key)
+        if files is None:
+            return False
+        for path, stamp in files.items():
+            if file_stamp(path) != stamp:
+                del self.ast_failures[key]
+                return False
+        return True
+
+    def build_ast(self, index, key, block, cgo_flags):
+        try:
+            header = self.ast_store.write_header(key, block)
+            tu = index.parse(
+                path=header,
+                args=cgo_flags + ["-x", "c-header"],
+                options=(
+                    clang.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD
+                    | clang.TranslationUnit.PARSE_INCOMPLETE
+                ),
+            )
+            if any(d.severity >= clang.Diagnostic.Fatal for d in tu.diagnostics):
+                # e.g. a missing header
+                self.ast_failures[key] = stat_files(self.get_includes(tu))
+                return None
+            ast = self.ast_store.save(key, tu, stat_files(self.get_includes(tu)))
+        except (
+            clang.TranslationUnitLoadError,
+            clang.TranslationUnitSaveError,
+            OSError,
+        ):
+            self.ast_store.discard(key)
+            return None
+
+        self.ast_loaded.add(ast)
+        return ast
+
+    def module_flags(self):
+        return [
+            "-fmodules",
+            "-fimplicit-module-maps",
+            "-fmodules-cache-path=" + self.module_directory,
+        ]
+
+    def is_module_failure(self, tu):
+        # headers without a usable module map or that aren't modular; other
+        # errors in the preamble don't count
+        for d in tu.diagnostics:
+            if d.severity >= clang.Diagnostic.Error and module_failure_pattern.match(
+                d.spelling
+            ):
+                return True
+        return False
+
+    def is_stale_pch(self, tu):
+        for d in tu.diagnostics:
+            if d.severity >= clang.Diagnostic.Fatal and "precompiled" in d.spelling:
+                return True
+        return False
+
+    def get_includes(self, tu):
+        includes = []
+        for inclusion in tu.get_includes():
+            name = inclusion.include.name
+            if name not in includes:
+                includes.append(name)
+        return includes
+
+    def version(self):
+        return clang.conf.lib.clang_getClangVersion()
+
+    def parse_candidates(self, result):
+        # result is a CodeCompletionResults.extract() tuple
+        cursor_kind, _, _, word, _type, placeholder, _ = result
+        completion = {"dup": 1, "word": ""}
+        sep = " "
+
+        if not word:
+            # early return
+            return completion
+
+        abbr = completion["info"] = placeholder + sep + _type
+
+        if cursor_kind == clang.CursorKind.STRUCT_DECL.value:
+            completion["word"] = "struct_" + word
+            completion["abbr"] = "struct_" + abbr
+        elif cursor_kind == clang.CursorKind.UNION_DECL.value:
+            completion["word"] = "union_" + word
+            completion["abbr"] = "union_" + abbr
+        elif cursor_kind == clang.CursorKind.ENUM_CONSTANT_DECL.value:
+            completion["word"] = "enum_" + word
+            completion["abbr"] = "enum_" + abbr
+        else:
+            completion["word"] = word
+            completion["abbr"] = abbr
+
+        completion["kind"] = (
+            CXCursor.kinds[cursor_kind]
+            if (cursor_kind in CXCursor.kinds)
+            else str(cursor_kind)
+        )
+
+        return completion
@@ -0,0 +1,66 @@
+# SPDX-FileCopyrightText: 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+import hashlib
+import json
+import os
+
+from fsutil import file_stamp, write_json_atomic
+
+# bump when the on-disk format changes
+STORE_VERSION = 1
+
+
+class CompletionStore(object):
+    # On-disk completion candidates shared by all nvim instances. Entries are
+    # keyed by preamble fingerprint, compile args and libclang version, and
+    # are only served while every header they were built from is unchanged.
+    #
+    # <directory>/v<STORE_VERSION>/<libclang>/<key[:2]>/<key>.json
+
+    def __init__(self, directory=None):
+        self.directory = directory
+
+    def key(self, fingerprint, cgo_flags, version):
+        h = hashlib.blake2b(digest_size=16)
+        for part in [fingerprint, version] + list(cgo_flags):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def path(self, key, version):
+        libclang = hashlib.blake2b(version.encode("utf-8"), digest_size=8).hexdigest()
+        return os.path.join(
+            self.directory,
+            "v%d" % STORE_VERSION,
+            libclang,
+            key[:2],
+            key + ".json",
+        )
+
+    def load(self, key, version):
+        if self.directory is None:
+            return None
+        try:
+            with open(self.path(key, version)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        for path, stamp in entry["files"].items():
+            if file_stamp(path) != stamp:
+                return None
+        return entry["candidates"], entry["files"]
+
+    def save(self, key, version, candidates, files):
+        # best effort, a cache directory that can't be written must never fail
+        # the completion itself
+        if self.directory is None:
+            return False
+        try:
+            write_json_atomic(
+                self.path(key, version), {"files": files, "candidates": candidates}
+            )
+        except OSError:
+            return False
+        return True
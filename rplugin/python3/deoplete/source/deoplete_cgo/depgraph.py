@@ -0,0 +1,63 @@
+# SPDX-FileCopyrightText: 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+import time
+
+from fsutil import file_stamp
+
+
+class DependencyGraph(object):
+    # Header dependency graph of the cached completions: the include closure
+    # of every cache key, and the reverse edges from each header to the keys
+    # that included it. Revalidation stats every header once, however many
+    # entries share it, and reports only the keys whose closure changed.
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.checked = 0.0
+
+        # key -> {path: stamp}
+        self.closures = dict()
+        # path -> set of keys
+        self.dependents = dict()
+
+    def __contains__(self, key):
+        return key in self.closures
+
+    def add(self, key, files):
+        self.remove(key)
+        self.closures[key] = dict(files)
+        for path in files:
+            self.dependents.setdefault(path, set()).add(key)
+
+    def remove(self, key):
+        for path in self.closures.pop(key, ()):
+            keys = self.dependents.get(path)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del self.dependents[path]
+
+    def retain(self, live):
+        # forget keys evicted from the cache
+        for key in [key for key in self.closures if key not in live]:
+            self.remove(key)
+
+    def changed_keys(self, force=False):
+        # throttled, headers rarely change while typing
+        now = time.monotonic()
+        if not force and now - self.checked < self.interval:
+            return set()
+        self.checked = now
+
+        changed = set()
+        for path, keys in self.dependents.items():
+            stamp = file_stamp(path)
+            for key in keys:
+                if key not in changed and self.closures[key][path] != stamp:
+                    changed.add(key)
+
+        for key in changed:
+            self.remove(key)
+        return changed
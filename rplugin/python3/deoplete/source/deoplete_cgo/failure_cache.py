@@ -0,0 +1,49 @@
+# SPDX-FileCopyrightText: 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+import time
+from collections import OrderedDict
+
+
+class FailureCache(object):
+    # Cache keys whose completion failed or came back empty, with the reason.
+    # A failed key isn't completed again until its backoff elapses, doubling
+    # with every consecutive failure, or until it's discarded because its
+    # included headers changed. An edit to the preamble or its flags is a new
+    # key and is tried right away.
+
+    def __init__(self, backoff=1.0, max_backoff=60.0, max_entries=256):
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_entries = max_entries
+
+        # key -> (reason, attempts, retry_at)
+        self.entries = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, key, reason):
+        _, attempts, _ = self.entries.pop(key, (None, 0, 0.0))
+        attempts += 1
+        delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+        self.entries[key] = (reason, attempts, time.monotonic() + delay)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def blocked(self, key):
+        entry = self.entries.get(key)
+        return entry is not None and time.monotonic() < entry[2]
+
+    def reason(self, key):
+        entry = self.entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def discard(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
@@ -0,0 +1,46 @@
+# SPDX-FileCopyrightText: 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+import hashlib
+import re
+
+# string and character literals are matched first so comment markers inside
+# them are kept as is
+comment_pattern = re.compile(
+    r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|/\*.*?\*/|//[^\n]*', re.S
+)
+
+
+def strip_comment(match):
+    text = match.group(0)
+    if text.startswith("/"):
+        return " "
+    return text
+
+
+def normalize_preamble(source):
+    # Drops comments, collapses whitespace and blank lines, and hoists the
+    # '#cgo' directives to the top, so cosmetic edits to the preamble map to
+    # the same text. The directives keep their order, which decides the order
+    # of the flags (and of the -I search path).
+    directives = []
+    lines = []
+    for line in comment_pattern.sub(strip_comment, source).splitlines():
+        line = " ".join(line.split())
+        if not line:
+            continue
+        if line.startswith("#cgo "):
+            directives.append(line)
+        else:
+            lines.append(line)
+
+    return "\n".join(directives + lines)
+
+
+def fingerprint(source, flags):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(normalize_preamble(source).encode("utf-8"))
+    for flag in flags:
+        h.update(b"\0")
+        h.update(flag.encode("utf-8"))
+    return h.hexdigest()
@@ -0,0 +1,44 @@
+# SPDX-FileCopyrightText: 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+import json
+import os
+import tempfile
+
+
+def file_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def stat_files(paths):
+    files = dict()
+    for path in paths:
+        stamp = file_stamp(path)
+        if stamp is not None:
+            files[path] = stamp
+    return files
+
+
+def write_json_atomic(path, data):
+    # write to a temporary file next to the target and rename it over, so
+    # concurrent nvim instances never read a partially written file; raises
+    # OSError when the file can't be written
+    tmp = None
+    try:
+        dirname = os.path.dirname(path)
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dirname, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except OSError:
+        if tmp is not None:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+        raise
@@ -0,0 +1,217 @@
+# SPDX-FileCopyrightText: 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+import json
+import os
+import signal
+import subprocess
+import threading
+import time
+
+from fsutil import file_stamp, write_json_atomic
+
+# bump when the on-disk format changes
+CACHE_VERSION = 1
+
+# how long the output of an already exited pkg-config may still take to arrive
+# after the deadline
+EXIT_GRACE = 0.1
+
+
+def is_exec(bin_path):
+    return os.path.isfile(bin_path) and os.access(bin_path, os.X_OK)
+
+
+class PkgConfig(object):
+    # Memoizes 'pkg-config --cflags --libs' per package and pkg-config search
+    # path, validated against the mtime and size of the resolved .pc file and
+    # persisted to disk so new nvim sessions don't pay for it again.
+
+    def __init__(self, binary="pkg-config", timeout=2.0):
+        self.binary = binary
+        self.timeout = timeout
+        self.cache_file = None
+        self.lock = threading.Lock()
+        self.entries = dict()
+        self.binaries = dict()
+        self.errors = []
+        # only the first failed save is reported
+        self.save_failed = False
+
+    def load(self, cache_file):
+        self.cache_file = cache_file
+        try:
+            with open(cache_file) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == CACHE_VERSION:
+            self.entries = data.get("entries", {})
+
+    def save(self):
+        # best effort, the flags are resolved either way
+        if self.cache_file is None:
+            return
+        try:
+            write_json_atomic(
+                self.cache_file, {"version": CACHE_VERSION, "entries": self.entries}
+            )
+        except OSError as e:
+            if not self.save_failed:
+                self.errors.append("pkg-config: can't write cache: %s" % e)
+            self.save_failed = True
+
+    def find_binary_path(self, path):
+        # memoized per $PATH value
+        env_path = os.environ.get("PATH", "")
+        key = (path, env_path)
+        if key not in self.binaries:
+            self.binaries[key] = self.lookup_binary_path(path, env_path)
+        return self.binaries[key]
+
+    def lookup_binary_path(self, path, env_path):
+        dirpath, binary = os.path.split(path)
+        if dirpath:
+            if is_exec(path):
+                return path
+        else:
+            for p in env_path.split(os.pathsep):
+                p = p.strip('"')
+                binary = os.path.join(p, path)
+                if is_exec(binary):
+                    return binary
+        return ""
+
+    def cache_key(self, pkg):
+        return "\0".join(
+            [
+                pkg,
+                os.environ.get("PKG_CONFIG_PATH", ""),
+                os.environ.get("PKG_CONFIG_LIBDIR", ""),
+            ]
+        )
+
+    def cached_flags(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        for path, stamp in entry["files"].items():
+            if file_stamp(path) != stamp:
+                return None
+        return entry["flags"]
+
+    def resolve(self, packages):
+        out = []
+        with self.lock:
+            pkgconfig = self.find_binary_path(self.binary)
+            if pkgconfig == "":
+                self.errors.append(self.binary + " binary not found")
+                return out
+
+            keys = dict((pkg, self.cache_key(pkg)) for pkg in packages)
+            flags = dict((pkg, self.cached_flags(keys[pkg])) for pkg in packages)
+
+            missing = [pkg for pkg in packages if flags[pkg] is None]
+            if missing:
+                for pkg, result in self.run(pkgconfig, missing).items():
+                    if result is None:
+                        # timed out, fall back to the last known flags
+                        entry = self.entries.get(keys[pkg])
+                        flags[pkg] = entry["flags"] if entry is not None else None
+                    else:
+                        flags[pkg] = result[0]
+                        self.entries[keys[pkg]] = {
+                            "flags": result[0],
+                            "files": result[1],
+                        }
+                self.save()
+
+            for pkg in packages:
+                if flags[pkg] is not None:
+                    out += flags[pkg]
+        return out
+
+    def run(self, pkgconfig, packages):
+        # Runs pkg-config for all packages concurrently and waits for them
+        # until a shared deadline. Returns {pkg: (flags, pc files)}, with None
+        # for packages that didn't finish in time; failed ones are left out.
+        procs = []
+        for pkg in packages:
+            try:
+                procs.append(
+                    (
+                        pkg,
+                        self.spawn([pkgconfig, pkg, "--cflags", "--libs"]),
+                        self.spawn([pkgconfig, "--variable=pcfiledir", pkg]),
+                    )
+                )
+            except OSError as e:
+                self.errors.append("pkg-config: %s: %s" % (pkg, e))
+
+        deadline = time.monotonic() + self.timeout
+        results = dict()
+        for pkg, flags_proc, dir_proc in procs:
+            flags = self.wait(flags_proc, deadline)
+            pcfiledir = self.wait(dir_proc, deadline)
+            if flags is False or pcfiledir is False:
+                self.errors.append(
+                    "pkg-config: %s timed out after %.1fs, using last known flags"
+                    % (pkg, self.timeout)
+                )
+                results[pkg] = None
+            elif flags is None:
+                self.errors.append("pkg-config: package %s not found" % pkg)
+            else:
+                results[pkg] = (flags.split(), self.pc_files(pcfiledir, pkg))
+        return results
+
+    def spawn(self, args):
+        return subprocess.Popen(
+            args,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            # its own process group, so kill() also reaches what a wrapper
+            # script started
+            start_new_session=True,
+        )
+
+    def wait(self, proc, deadline):
+        # stdout of a successful run, None on failure and False on timeout
+        timeout = max(deadline - time.monotonic(), 0)
+        if proc.poll() is not None:
+            # already done, even if an earlier package used up the deadline
+            timeout = max(timeout, EXIT_GRACE)
+        try:
+            out, _ = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.kill(proc)
+            return False
+        if proc.returncode != 0:
+            return None
+        return out
+
+    def kill(self, proc):
+        # A grandchild may still hold stdout open, so the pipe is closed
+        # without draining it and only the direct child is waited for.
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+        except OSError:
+            pass
+        proc.stdout.close()
+        proc.wait()
+
+    def pc_files(self, pcfiledir, pkg):
+        if not pcfiledir:
+            return {}
+        path = os.path.join(pcfiledir.strip(), pkg + ".pc")
+        stamp = file_stamp(path)
+        return {path: stamp} if stamp is not None else {}
+
+    def drain_errors(self):
+        with self.lock:
+            errors, self.errors = self.errors, []
+        return errors
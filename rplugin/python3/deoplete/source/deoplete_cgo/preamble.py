@@ -0,0 +1,146 @@
+# SPDX-FileCopyrightText: 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+import platform
+import re
+import sys
+from collections import namedtuple
+
+# source      -- C source of the preamble, '#cgo' lines blanked out
+# line_count  -- number of lines in source
+# start, end  -- 0-based line span [start, end) of the preamble comment
+# import_line -- 0-based line of 'import "C"' (or '"C"' in an import group)
+# directives  -- list of (name, value, constraints) parsed '#cgo' directives
+Preamble = namedtuple(
+    "Preamble", ["source", "line_count", "start", "end", "import_line", "directives"]
+)
+
+cgo_pattern = re.compile(r"\s*#cgo\s+([^:]*?)\s*:\s*(.*)$")
+
+# Go requires imports before any other declaration, so the scan stops there
+decl_prefixes = ("func ", "func(", "type ", "var ", "const ")
+
+
+def parse_directive(line):
+    m = cgo_pattern.match(line)
+    if m is None:
+        return None
+    fields = m.group(1).split()
+    if not fields:
+        return None
+    return (fields[-1], m.group(2).strip(), " ".join(fields[:-1]))
+
+
+def build_preamble(lines, start, end, import_line):
+    directives = []
+    source = []
+    for line in lines:
+        if line.lstrip().startswith("#cgo"):
+            directive = parse_directive(line)
+            if directive is not None:
+                directives.append(directive)
+            # keep the line so line numbers still match the buffer
+            source.append("")
+        else:
+            source.append(line)
+
+    # an empty preamble still occupies one (empty) line of the parsed file
+    return Preamble(
+        "\n".join(source), len(source) or 1, start, end, import_line, directives
+    )
+
+
+def scan_preamble(buffer):
+    # Single forward pass over the buffer. Tracks the comment group directly
+    # preceding each line, and returns it as the preamble when that line is
+    # 'import "C"' (or '"C"' inside an 'import ( ... )' block). Returns None for
+    # buffers without cgo.
+    in_block = False
+    in_group = False
+    start = -1
+    end = -1
+    lines = []
+
+    for i, line in enumerate(buffer):
+        if in_block:
+            pos = line.find("*/")
+            if pos < 0:
+                lines.append(line)
+                continue
+            in_block = False
+            if line[:pos].strip():
+                lines.append(line[:pos])
+            end = i + 1
+            continue
+
+        stripped = line.strip()
+        if stripped.startswith("//"):
+            if end != i:
+                start = i
+                lines = []
+            lines.append(stripped[2:])
+            end = i + 1
+        elif stripped.startswith("/*"):
+            if end != i:
+                start = i
+                lines = []
+            body = stripped[2:]
+            pos = body.find("*/")
+            if pos < 0:
+                in_block = True
+                if body.strip():
+                    lines.append(body)
+            else:
+                if body[:pos].strip():
+                    lines.append(body[:pos])
+                end = i + 1
+        else:
+            code = stripped.split("//", 1)[0].strip()
+            if code == 'import "C"' or (in_group and code == '"C"'):
+                if end == i:
+                    return build_preamble(lines, start, end, i)
+                return build_preamble([], i, i, i)
+            if code.startswith("import ("):
+                in_group = True
+            elif in_group and code == ")":
+                in_group = False
+            elif not in_group and code.startswith(decl_prefixes):
+                break
+            end = -1
+
+    return None
+
+
+goos = {"darwin": "darwin", "win32": "windows", "cygwin": "windows"}.get(
+    sys.platform, re.sub(r"\d+$", "", sys.platform)
+)
+goarch = {
+    "x86_64": "amd64",
+    "amd64": "amd64",
+    "i386": "386",
+    "i686": "386",
+    "aarch64": "arm64",
+    "arm64": "arm64",
+    "armv7l": "arm",
+    "ppc64le": "ppc64le",
+    "s390x": "s390x",
+}.get(platform.machine().lower(), platform.machine().lower())
+
+
+def directive_matches(constraints):
+    # '#cgo' build constraints: space separated terms are OR'ed, comma
+    # separated options are AND'ed, and '!' negates an option.
+    if not constraints:
+        return True
+
+    def option_matches(option):
+        if option.startswith("!"):
+            return not option_matches(option[1:])
+        return option in (goos, goarch, "cgo") or (
+            option == "unix" and goos not in ("windows", "plan9")
+        )
+
+    return any(
+        all(option_matches(option) for option in term.split(","))
+        for term in constraints.split()
+    )
@@ -0,0 +1,94 @@
+# SPDX-FileCopyrightText: 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+import sys
+from array import array
+from bisect import bisect_left
+
+POINTER_SIZE = 8
+STR_OVERHEAD = sys.getsizeof("")
+
+
+class PrefixIndex(object):
+    # The candidates of one cache entry with a sorted index over their
+    # case-folded words, so a keystroke only costs a binary search and the
+    # matching slice instead of the whole list.
+    #
+    # Candidates are kept as parallel arrays of word, abbr, info and kind, with
+    # equal strings shared through a string table (abbr and info are usually
+    # the same, and there are only a few kinds). Dicts are only built for the
+    # candidates returned to deoplete.
+
+    __slots__ = ("words", "abbrs", "infos", "kinds", "folded", "positions", "size")
+
+    def __init__(self, candidates):
+        strings = dict()
+        intern = strings.setdefault
+
+        self.words = []
+        self.abbrs = []
+        self.infos = []
+        self.kinds = []
+        for c in candidates:
+            self.words.append(intern(c["word"], c["word"]))
+            for field, values in (
+                ("abbr", self.abbrs),
+                ("info", self.infos),
+                ("kind", self.kinds),
+            ):
+                value = c.get(field, "")
+                values.append(intern(value, value))
+
+        entries = []
+        for i, word in enumerate(self.words):
+            folded = word.lower()
+            entries.append((intern(folded, folded), i))
+        entries.sort()
+        self.folded = [word for word, _ in entries]
+        self.positions = array("I", [i for _, i in entries])
+
+        self.size = (
+            sum(STR_OVERHEAD + len(s) for s in strings)
+            + 5 * POINTER_SIZE * len(self.words)
+            + self.positions.itemsize * len(self.positions)
+        )
+
+    def __iter__(self):
+        return iter(self.materialize(range(len(self.words))))
+
+    def __len__(self):
+        return len(self.words)
+
+    def approximate_size(self):
+        return self.size
+
+    def materialize(self, positions):
+        words = self.words
+        abbrs = self.abbrs
+        infos = self.infos
+        kinds = self.kinds
+        candidates = []
+        for i in positions:
+            if not words[i]:
+                candidates.append({"dup": 1, "word": ""})
+                continue
+            candidates.append(
+                {
+                    "word": words[i],
+                    "abbr": abbrs[i],
+                    "info": infos[i],
+                    "kind": kinds[i],
+                    "dup": 1,
+                }
+            )
+        return candidates
+
+    def match(self, prefix):
+        # candidates whose word starts with prefix, ignoring case, in their
+        # original order
+        if not prefix:
+            return self.materialize(range(len(self.words)))
+        prefix = prefix.lower()
+        lo = bisect_left(self.folded, prefix)
+        hi = bisect_left(self.folded, prefix[:-1] + chr(ord(prefix[-1]) + 1), lo)
+        return self.materialize(sorted(self.positions[lo:hi]))
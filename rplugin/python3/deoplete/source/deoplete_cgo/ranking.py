@@ -0,0 +1,45 @@
+# SPDX-FileCopyrightText: 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+import heapq
+from itertools import islice
+
+# sort keys of CodeCompletionResults.extract() tuples by sort_algo, lower first
+sort_keys = {
+    "priority": lambda result: result[1],
+    "alphabetical": lambda result: result[3].lower(),
+    "combined": lambda result: (result[1], result[3].lower()),
+}
+
+
+def rank(results, sort_algo=None, limit=0):
+    # Orders the results by sort_algo and keeps the first limit of them (all
+    # when limit is 0). Each key is computed once, and a top-K selection with
+    # heapq replaces the full sort when limit is smaller than the results.
+    # Results without typed text never become candidates, so they are dropped
+    # first rather than taking up places of the limit.
+    results = [result for result in results if result[3]]
+    key = sort_keys.get(sort_algo)
+    if key is None:
+        return results[:limit] if limit else results
+
+    # the index keeps equal keys in their original order
+    decorated = [(key(result), i) for i, result in enumerate(results)]
+    if limit and limit < len(decorated):
+        decorated = heapq.nsmallest(limit, decorated)
+    else:
+        decorated.sort()
+    return [results[i] for _, i in decorated]
+
+
+def merge(ranked, results, sort_algo, limit=0):
+    # Like rank(ranked + results, ...) for ranked already in sort_algo order,
+    # e.g. sorted by libclang: only results are sorted, then merged in.
+    #
+    # heapq.merge needs ranked to be ordered by sort_keys[sort_algo]. That only
+    # holds once the results without typed text are gone: libclang sorted them
+    # by the spelling skip_spellings removed ("main", "struct"), and it puts
+    # empty names last.
+    ranked = [result for result in ranked if result[3]]
+    merged = heapq.merge(ranked, rank(results, sort_algo), key=sort_keys[sort_algo])
+    return list(islice(merged, limit)) if limit else list(merged)
@@ -0,0 +1,52 @@
+# SPDX-FileCopyrightText: 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+import re
+from collections import OrderedDict
+
+include_pattern = re.compile(r"^\s*#\s*(?:include|import)\s*([<\"][^>\"]+[>\"])", re.M)
+
+
+def include_set(source):
+    return frozenset(include_pattern.findall(source))
+
+
+class TUPool(object):
+    # Keeps live TranslationUnits keyed by the compile args and the set of
+    # included headers, so a preamble edit that keeps both stable only costs a
+    # clang_reparseTranslationUnit instead of a full parse.
+
+    def __init__(self, max_size=8):
+        self.max_size = max_size
+        self.pool = OrderedDict()
+
+    def key(self, args, source):
+        return (tuple(args), include_set(source))
+
+    def acquire(self, index, path, args, source, unsaved_files, options):
+        key = self.key(args, source)
+
+        tu = self.pool.get(key)
+        if tu is not None:
+            self.pool.move_to_end(key)
+            try:
+                tu.reparse(unsaved_files=unsaved_files)
+                return tu
+            except Exception:
+                # libclang invalidates the TU on a failed reparse
+                del self.pool[key]
+
+        tu = index.parse(
+            path=path, args=args, unsaved_files=unsaved_files, options=options
+        )
+        self.pool[key] = tu
+        while len(self.pool) > self.max_size:
+            self.pool.popitem(last=False)
+
+        return tu
+
+    def discard(self, args, source):
+        self.pool.pop(self.key(args, source), None)
+
+    def clear(self):
+        self.pool.clear()
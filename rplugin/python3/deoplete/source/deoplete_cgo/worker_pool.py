@@ -0,0 +1,143 @@
+# SPDX-FileCopyrightText: 2021 The deoplete-plugins Authors
+# SPDX-License-Identifier: MIT
+
+import marshal
+import os
+import struct
+import subprocess
+import sys
+import threading
+
+from candidates import unpack_candidates
+
+WORKER_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "cgo_worker.py"
+)
+
+header = struct.Struct("<I")
+
+
+class WorkerError(Exception):
+    pass
+
+
+def read_message(stream):
+    data = stream.read(header.size)
+    if len(data) < header.size:
+        return None
+    (size,) = header.unpack(data)
+    return marshal.loads(stream.read(size))
+
+
+def write_message(stream, message):
+    data = marshal.dumps(message)
+    stream.write(header.pack(len(data)))
+    stream.write(data)
+    stream.flush()
+
+
+class WorkerProcess(object):
+    # A cgo_worker.py child with its own libclang Index and TU pool. Requests
+    # are serialized by a lock; a dead child is restarted on the next request.
+
+    def __init__(
+        self, library_file, ast_directory, shared_pch=False, module_directory=""
+    ):
+        self.library_file = library_file
+        self.ast_directory = ast_directory
+        self.shared_pch = shared_pch
+        self.module_directory = module_directory
+        self.lock = threading.Lock()
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                WORKER_SCRIPT,
+                self.library_file,
+                self.ast_directory,
+                "1" if self.shared_pch else "0",
+                self.module_directory,
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def request(self, message):
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                self.start()
+
+            try:
+                write_message(self.process.stdin, message)
+                response = read_message(self.process.stdout)
+            except (OSError, ValueError, EOFError):
+                response = None
+
+            if response is None:
+                # crashed (e.g. on a malformed header), restart lazily
+                try:
+                    returncode = self.process.wait(timeout=1)
+                except subprocess.TimeoutExpired:
+                    returncode = None
+                self.stop()
+                raise WorkerError("cgo worker exited with %s" % returncode)
+
+        status, payload = response
+        if status != "ok":
+            raise WorkerError(payload)
+        return payload
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+            self.process.kill()
+            self.process.wait()
+        except OSError:
+            pass
+        self.process = None
+
+
+class WorkerPool(object):
+    # Routes completion requests to worker processes by preamble fingerprint,
+    # so each worker keeps its TranslationUnits warm for the same preambles.
+
+    def __init__(
+        self,
+        size,
+        library_file,
+        ast_directory=None,
+        shared_pch=False,
+        module_directory=None,
+    ):
+        self.workers = [
+            WorkerProcess(
+                library_file, ast_directory or "", shared_pch, module_directory or ""
+            )
+            for _ in range(size)
+        ]
+
+    def __len__(self):
+        return len(self.workers)
+
+    def route(self, key):
+        return self.workers[int(key[:8], 16) % len(self.workers)]
+
+    def complete(
+        self, key, source, line_count, cgo_flags, sort_algo, max_candidates=0
+    ):
+        records, includes = self.route(key).request(
+            ("complete", source, line_count, cgo_flags, sort_algo, max_candidates)
+        )
+        return unpack_candidates(records), includes
+
+    def version(self):
+        return self.workers[0].request(("version",))
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()